@@ -4,6 +4,7 @@ Enhanced Firebase Functions for RAG Prompt Library - Blaze Plan Optimized
 import os
 import json
 import logging
+import re
 from typing import Any, Dict, List, Optional
 from datetime import datetime, timedelta
 
@@ -27,6 +28,9 @@ initialize_app()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Compiled once; prompt scoring and variable extraction run per request
+_VARIABLE_RE = re.compile(r'\{([^}]+)\}')
+
 # Configuration for Blaze Plan optimizations
 OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY')
 OPENROUTER_API_KEY_RAG = os.environ.get('OPENROUTER_API_KEY_RAG')
@@ -220,9 +224,8 @@ Please provide helpful, accurate, and professional assistance."""
 
 def _extract_variables(prompt: str) -> List[Dict[str, str]]:
     """Extract variables from prompt text"""
-    import re
     variables = []
-    matches = re.findall(r'\{([^}]+)\}', prompt)
+    matches = _VARIABLE_RE.findall(prompt)
 
     for match in matches:
         variables.append({
@@ -1,11 +1,19 @@
 from firebase_functions import https_fn, firestore_fn, storage_fn
 from firebase_admin import initialize_app, firestore, storage
+import functools
 import json
 import os
 import asyncio
 from typing import Any, Dict, List
 import logging
 
+try:
+    # C-backed JSON parser for hot request/response paths; stdlib fallback
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 # Import RAG components
 from src.rag.document_processor import DocumentProcessor
 from src.rag.text_chunker import TextChunker, ChunkingConfig
@@ -24,6 +32,11 @@ initialize_app()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Hoisted constants for prompt quality scoring; these run on every
+# generation request, so the scans shouldn't rebuild their patterns
+_INSTRUCTION_WORDS = ('please', 'you are', 'your task')
+_CONTEXT_TOKENS = ('{{context}}', '{{ context }}')
+
 # Initialize RAG components
 document_processor = DocumentProcessor()
 text_chunker = TextChunker()
@@ -246,6 +259,8 @@ async def _process_document_async(doc_id: str, doc_data: Dict):
         if user_id:
             vector_store = FAISSVectorStore(user_id)
             await vector_store.add_chunks(chunks_with_embeddings)
+            # Drop any cached store so the next retrieval sees the new chunks
+            ContextRetriever.invalidate(user_id)
         else:
             logger.warning("No user ID found for vector store update")
 
@@ -507,9 +522,9 @@ Return your response as a JSON object with the following structure:
 
         # Parse the JSON response
         try:
-            import json
-            response_data = json.loads(llm_response.content)
-        except json.JSONDecodeError:
+            response_data = _json_loads(llm_response.content)
+        except ValueError:
+            # Both orjson and stdlib json raise ValueError subclasses
             # Fallback if JSON parsing fails
             response_data = _create_fallback_response(
                 llm_response.content, purpose, industry, input_variables
@@ -548,12 +563,29 @@ def _build_generation_prompt(purpose: str, industry: str, use_case: str,
                            output_format: str, tone: str, length: str,
                            include_rag: bool, additional_requirements: str) -> str:
     """Build the prompt for AI generation"""
+    # Canonicalize the variable dicts into a hashable key so repeated
+    # requests for the same specification reuse the memoized template
+    vars_key = tuple(
+        (var.get('name', ''), var.get('description', ''), var.get('type', 'string'))
+        for var in (input_variables or [])
+    )
+    return _build_generation_prompt_cached(
+        purpose, industry, use_case, target_audience, vars_key,
+        output_format, tone, length, include_rag, additional_requirements
+    )
+
+@functools.lru_cache(maxsize=512)
+def _build_generation_prompt_cached(purpose: str, industry: str, use_case: str,
+                                    target_audience: str, vars_key: tuple,
+                                    output_format: str, tone: str, length: str,
+                                    include_rag: bool, additional_requirements: str) -> str:
+    """Assemble the generation prompt (memoized on all inputs)"""
 
     variables_text = ""
-    if input_variables:
+    if vars_key:
         variables_text = "\n\nRequired Variables:\n"
-        for var in input_variables:
-            variables_text += f"- {{{{ {var.get('name', '')} }}}}: {var.get('description', '')} ({var.get('type', 'string')})\n"
+        for name, description, var_type in vars_key:
+            variables_text += f"- {{{{ {name} }}}}: {description} ({var_type})\n"
 
     rag_instruction = ""
     if include_rag:
@@ -632,27 +664,36 @@ def _calculate_quality_score(prompt: str, variables: List[Dict]) -> Dict[str, An
             'suggestions': []
         }
 
+    # Derive the shared inputs once; every subscore below reads from
+    # these instead of rescanning the prompt string
+    lowered = prompt.lower()
+    word_count = len(prompt.split())
+    open_braces = prompt.count('{{')
+    close_braces = prompt.count('}}')
+
     # Basic scoring algorithm
     structure_score = 70  # Base score
-    if len(prompt.split('\n')) > 1:
+    if '\n' in prompt:
         structure_score += 10  # Multi-line structure
-    if any(word in prompt.lower() for word in ['please', 'you are', 'your task']):
+    if any(word in lowered for word in _INSTRUCTION_WORDS):
         structure_score += 10  # Clear instructions
 
     clarity_score = 70  # Base score
-    if len(prompt.split()) > 20:
+    if word_count > 20:
         clarity_score += 10  # Sufficient detail
-    if prompt.count('{{') == prompt.count('}}'):
+    if open_braces == close_braces:
         clarity_score += 10  # Proper variable syntax
 
     variables_score = 50  # Base score
     if variables:
         variables_score = 80  # Has variables
-        if all('{{' + var.get('name', '') + '}}' in prompt for var in variables):
+        # Exact {{name}} substring checks, matching how templates render
+        # placeholders; all() short-circuits on the first unused variable
+        if all(f"{{{{{var.get('name', '')}}}}}" in prompt for var in variables):
             variables_score = 90  # All variables used
 
     rag_score = 60  # Base score
-    if '{{context}}' in prompt or 'context' in prompt.lower():
+    if any(token in prompt for token in _CONTEXT_TOKENS) or 'context' in lowered:
         rag_score = 85  # RAG compatible
 
     overall = (structure_score + clarity_score + variables_score + rag_score) // 4
@@ -4,17 +4,35 @@ Handles LLM API calls using OpenRouter.ai with Llama models
 """
 
 import asyncio
+import hashlib
 import json
 import logging
+import random
 import time
+from types import MappingProxyType
 from typing import Dict, List, Optional, AsyncGenerator, Any
 from dataclasses import dataclass
 import aiohttp
 import tiktoken
 
+try:
+    # orjson serializes straight to bytes, which aiohttp posts without a
+    # separate UTF-8 encode; stdlib json is the fallback
+    import orjson
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+    _json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class OpenRouterConfig:
     """Configuration for OpenRouter API"""
     api_key: str
@@ -27,7 +45,9 @@ class OpenRouterConfig:
     retry_delay: float = 1.0
     timeout: int = 60
 
-@dataclass
+# slots avoids a per-instance __dict__ (~100 B each); one LLMResponse is
+# allocated per API call, and configs are long-lived but widely shared
+@dataclass(slots=True, frozen=True)
 class LLMResponse:
     """Response from LLM API"""
     content: str
@@ -48,11 +68,29 @@ class OpenRouterClient:
         "google/gemma-2-9b-it:free": {"input": 0.0, "output": 0.0},
         "microsoft/phi-3-mini-128k-instruct:free": {"input": 0.0, "output": 0.0}
     }
-    
-    def __init__(self, config: OpenRouterConfig):
+
+    # In-process response cache: only near-deterministic generations
+    # (low temperature) are cached, since higher temperatures are
+    # expected to produce different output per call
+    CACHE_MAX_TEMPERATURE = 0.3
+    CACHE_TTL = 300.0  # seconds
+    CACHE_MAX_ENTRIES = 256
+
+
+    def __init__(self, config: OpenRouterConfig, session: Optional[aiohttp.ClientSession] = None):
         self.config = config
-        self.session = None
-        
+        # An externally-owned session can be shared across clients to keep
+        # TCP/TLS connections warm between calls; it is never closed here
+        self._external_session = session
+        self.session = session
+        self._headers = {
+            "Authorization": f"Bearer {config.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://promptlibrary.dev",  # Optional: your site URL
+            "X-Title": "RAG Prompt Library"  # Optional: app name
+        }
+
+
         # Initialize tokenizer for token counting
         try:
             self.tokenizer = tiktoken.encoding_for_model("gpt-3.5-turbo")  # Use as approximation
@@ -62,23 +100,47 @@ class OpenRouterClient:
         # Validate model
         if config.model not in self.MODEL_PRICING:
             logger.warning(f"Model {config.model} not in pricing table, using default pricing")
+
+        # Free models always cost 0.0; flag it once so per-response cost
+        # calculation can skip the pricing lookup and arithmetic
+        pricing = self.MODEL_PRICING.get(config.model, {"input": 0.0, "output": 0.0})
+        self._is_free = pricing["input"] == 0.0 and pricing["output"] == 0.0
+
+        # Response cache keyed by a digest of the full request
+        self._resp_cache: Dict[bytes, tuple] = {}  # key -> (stored_at, LLMResponse)
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+        # Model info never changes after construction; build it once
+        self._model_info = MappingProxyType({
+            "model": config.model,
+            "max_tokens": config.max_tokens,
+            "temperature": config.temperature,
+            "top_p": config.top_p,
+            "pricing": pricing,
+            "is_free": config.model.endswith(":free")
+        })
     
     async def __aenter__(self):
         """Async context manager entry"""
-        self.session = aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=self.config.timeout),
-            headers={
-                "Authorization": f"Bearer {self.config.api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://promptlibrary.dev",  # Optional: your site URL
-                "X-Title": "RAG Prompt Library"  # Optional: app name
-            }
-        )
+        if self._external_session is not None:
+            self.session = self._external_session
+        else:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=100,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.config.timeout),
+                headers=self._headers
+            )
         return self
-    
+
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Async context manager exit"""
-        if self.session:
+        # Only close sessions we created; shared sessions outlive the client
+        if self.session and self._external_session is None:
             await self.session.close()
     
     async def generate_response(self, prompt: str, system_prompt: Optional[str] = None, 
@@ -96,9 +158,20 @@ class OpenRouterClient:
         """
         if not self.session:
             raise RuntimeError("Client not initialized. Use async context manager.")
-        
+
+        # Serve repeated near-deterministic requests from the in-process
+        # cache; a hit skips the network round trip entirely
+        cache_key = None
+        if not stream and self.config.temperature <= self.CACHE_MAX_TEMPERATURE:
+            cache_key = self._cache_key(prompt, system_prompt)
+            cached = self._resp_cache.get(cache_key)
+            if cached is not None and time.time() - cached[0] < self.CACHE_TTL:
+                self._cache_hits += 1
+                return cached[1]
+            self._cache_misses += 1
+
         start_time = time.time()
-        
+
         try:
             # Prepare messages
             messages = []
@@ -124,35 +197,83 @@ class OpenRouterClient:
                 # Handle streaming response (not implemented in this version)
                 raise NotImplementedError("Streaming not implemented yet")
             else:
-                return self._process_response(response_data, start_time)
+                response = self._process_response(response_data, start_time)
+                if cache_key is not None:
+                    self._cache_store(cache_key, response)
+                return response
                 
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
             raise
     
+    def _cache_key(self, prompt: str, system_prompt: Optional[str]) -> bytes:
+        """Digest of everything that determines the response"""
+        hasher = hashlib.blake2b(digest_size=16)
+        for part in (self.config.model, str(self.config.temperature),
+                     str(self.config.top_p), str(self.config.max_tokens),
+                     system_prompt or '', prompt):
+            hasher.update(part.encode('utf-8'))
+            hasher.update(b'\x00')
+        return hasher.digest()
+
+    def _cache_store(self, cache_key: bytes, response: 'LLMResponse'):
+        """Insert a response, evicting the oldest entry when full"""
+        while len(self._resp_cache) >= self.CACHE_MAX_ENTRIES:
+            self._resp_cache.pop(next(iter(self._resp_cache)))
+        self._resp_cache[cache_key] = (time.time(), response)
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Get response-cache hit/miss statistics"""
+        return {
+            'hits': self._cache_hits,
+            'misses': self._cache_misses,
+            'entries': len(self._resp_cache)
+        }
+
+    def _backoff_delay(self, attempt: int, retry_after=None) -> float:
+        """Exponential backoff with full jitter for one retry attempt
+
+        Jitter decorrelates concurrent clients hitting the same rate
+        limit so they don't retry in lockstep. A parseable Retry-After
+        header from the server takes precedence.
+        """
+        if retry_after is not None:
+            try:
+                return max(float(retry_after), 0.0)
+            except (TypeError, ValueError):
+                pass
+
+        ceiling = self.config.retry_delay * (2 ** attempt)
+        return random.uniform(ceiling / 2, ceiling)
+
     async def _make_request_with_retry(self, payload: Dict) -> Dict:
         """Make API request with retry logic"""
         last_exception = None
-        
+
         for attempt in range(self.config.max_retries):
             try:
                 async with self.session.post(
                     f"{self.config.base_url}/chat/completions",
-                    json=payload
+                    data=_json_dumps(payload),
+                    headers=self._headers
                 ) as response:
-                    
+
                     if response.status == 200:
-                        return await response.json()
-                    
+                        # Parse straight from bytes; response.json() would
+                        # first decode the body into an intermediate str
+                        return _json_loads(await response.read())
+
                     elif response.status == 429:  # Rate limit
-                        wait_time = self.config.retry_delay * (2 ** attempt)
-                        logger.warning(f"Rate limited, waiting {wait_time}s (attempt {attempt + 1})")
+                        wait_time = self._backoff_delay(
+                            attempt, response.headers.get('Retry-After')
+                        )
+                        logger.warning(f"Rate limited, waiting {wait_time:.2f}s (attempt {attempt + 1})")
                         await asyncio.sleep(wait_time)
                         continue
-                    
+
                     elif response.status >= 500:  # Server error
-                        wait_time = self.config.retry_delay * (2 ** attempt)
-                        logger.warning(f"Server error {response.status}, retrying in {wait_time}s")
+                        wait_time = self._backoff_delay(attempt)
+                        logger.warning(f"Server error {response.status}, retrying in {wait_time:.2f}s")
                         await asyncio.sleep(wait_time)
                         continue
                     
@@ -164,8 +285,8 @@ class OpenRouterClient:
             except aiohttp.ClientError as e:
                 last_exception = e
                 if attempt < self.config.max_retries - 1:
-                    wait_time = self.config.retry_delay * (2 ** attempt)
-                    logger.warning(f"Request failed, retrying in {wait_time}s: {str(e)}")
+                    wait_time = self._backoff_delay(attempt)
+                    logger.warning(f"Request failed, retrying in {wait_time:.2f}s: {str(e)}")
                     await asyncio.sleep(wait_time)
                     continue
                 else:
@@ -216,11 +337,14 @@ class OpenRouterClient:
     
     def _calculate_cost(self, prompt_tokens: int, completion_tokens: int) -> float:
         """Calculate estimated cost for the request"""
+        if self._is_free:
+            return 0.0
+
         pricing = self.MODEL_PRICING.get(self.config.model, {"input": 0.0, "output": 0.0})
-        
+
         input_cost = (prompt_tokens / 1_000_000) * pricing["input"]
         output_cost = (completion_tokens / 1_000_000) * pricing["output"]
-        
+
         return input_cost + output_cost
     
     def count_tokens(self, text: str) -> int:
@@ -281,7 +405,8 @@ Please use the context information to provide a comprehensive and accurate respo
             
             async with self.session.post(
                 f"{self.config.base_url}/chat/completions",
-                json=payload
+                data=_json_dumps(payload),
+                headers=self._headers
             ) as response:
                 return response.status == 200
                 
@@ -290,11 +415,6 @@ Please use the context information to provide a comprehensive and accurate respo
     
     def get_model_info(self) -> Dict[str, Any]:
         """Get information about the current model"""
-        return {
-            "model": self.config.model,
-            "max_tokens": self.config.max_tokens,
-            "temperature": self.config.temperature,
-            "top_p": self.config.top_p,
-            "pricing": self.MODEL_PRICING.get(self.config.model, {"input": 0.0, "output": 0.0}),
-            "is_free": self.config.model.endswith(":free")
-        }
+        # Copy into a plain dict: callers embed this in JSON responses and
+        # a mappingproxy is not serializable
+        return dict(self._model_info)
@@ -4,30 +4,41 @@ Retrieves relevant document chunks and formats context for prompt execution
 """
 
 import logging
-from typing import Dict, List, Optional, Tuple
+from types import MappingProxyType
+from typing import ClassVar, Dict, List, Optional, Tuple
 from dataclasses import dataclass
 
+import tiktoken
 from firebase_admin import firestore
 from .vector_store import FAISSVectorStore
 from .embedding_generator import EmbeddingGenerator
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class RetrievalConfig:
     """Configuration for context retrieval"""
     top_k: int = 5
     similarity_threshold: float = 0.7
-    max_context_length: int = 4000
+    max_context_tokens: int = 4000
     include_metadata: bool = True
     rerank_results: bool = True
 
 class ContextRetriever:
     """Retrieves and formats context for RAG-enhanced prompt execution"""
-    
-    def __init__(self, embedding_generator: EmbeddingGenerator, config: Optional[RetrievalConfig] = None):
+
+    def __init__(self, embedding_generator: EmbeddingGenerator, config: Optional[RetrievalConfig] = None,
+                 encoding: Optional[tiktoken.Encoding] = None):
         self.embedding_generator = embedding_generator
         self.config = config or RetrievalConfig()
+        # Reuse the embedding generator's tokenizer so context truncation
+        # happens at token boundaries instead of mid-character
+        if encoding is not None:
+            self.encoding = encoding
+        elif isinstance(getattr(embedding_generator, 'encoding', None), tiktoken.Encoding):
+            self.encoding = embedding_generator.encoding
+        else:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
         self.db = firestore.client()
     
     async def retrieve_context(self, user_id: str, query: str, document_ids: Optional[List[str]] = None) -> Dict:
@@ -49,9 +60,9 @@ class ContextRetriever:
                 logger.error("Failed to generate query embedding")
                 return self._empty_context_response()
             
-            # Initialize vector store
-            vector_store = FAISSVectorStore(user_id)
-            if not await vector_store.initialize_index():
+            # Get a cached (or freshly initialized) vector store
+            vector_store = await self._get_vector_store(user_id)
+            if vector_store is None:
                 logger.warning(f"No vector index found for user {user_id}")
                 return self._empty_context_response()
             
@@ -73,8 +84,25 @@ class ContextRetriever:
                     if result['document_id'] in document_ids
                 ]
             
-            # Retrieve full chunk content from Firestore
-            enriched_chunks = await self._enrich_chunks_with_content(search_results)
+            # Results carrying inline content skip the Firestore round trip;
+            # only oversized chunks need the second fetch
+            enriched_chunks = []
+            needs_fetch = []
+            for result in search_results:
+                if 'content' in result:
+                    metadata = result.get('metadata', {})
+                    enriched_chunks.append({
+                        **result,
+                        'full_metadata': metadata,
+                        '_source_info': self._build_source_info(metadata),
+                        'created_at': None
+                    })
+                else:
+                    needs_fetch.append(result)
+
+            if needs_fetch:
+                enriched_chunks.extend(await self._enrich_chunks_with_content(needs_fetch))
+                enriched_chunks.sort(key=lambda c: c['similarity_score'], reverse=True)
             
             # Rerank results if enabled
             if self.config.rerank_results:
@@ -100,6 +128,15 @@ class ContextRetriever:
             logger.error(f"Error retrieving context: {str(e)}")
             return self._empty_context_response()
     
+    async def _get_vector_store(self, user_id: str) -> Optional[FAISSVectorStore]:
+        """Get an initialized vector store for a user, using the shared cache"""
+        return await FAISSVectorStore.get_for_user(user_id)
+
+    @classmethod
+    def invalidate(cls, user_id: str):
+        """Drop a user's cached vector store (call after document updates)"""
+        FAISSVectorStore.invalidate(user_id)
+
     async def _enrich_chunks_with_content(self, search_results: List[Dict]) -> List[Dict]:
         """Retrieve full content for chunks from Firestore"""
         enriched_chunks = []
@@ -113,20 +150,24 @@ class ContextRetriever:
                 
                 if chunk_doc.exists:
                     chunk_data = chunk_doc.to_dict()
+                    metadata = chunk_data.get('metadata', {})
                     enriched_chunk = {
                         **result,
                         'content': chunk_data.get('content', result['content_preview']),
-                        'full_metadata': chunk_data.get('metadata', {}),
+                        'full_metadata': metadata,
+                        '_source_info': self._build_source_info(metadata),
                         'created_at': chunk_data.get('createdAt')
                     }
                     enriched_chunks.append(enriched_chunk)
                 else:
                     logger.warning(f"Chunk {result['chunk_id']} not found in Firestore")
                     # Use preview content as fallback
+                    metadata = result.get('metadata', {})
                     enriched_chunks.append({
                         **result,
                         'content': result['content_preview'],
-                        'full_metadata': result.get('metadata', {}),
+                        'full_metadata': metadata,
+                        '_source_info': self._build_source_info(metadata),
                         'created_at': None
                     })
                     
@@ -157,58 +198,81 @@ class ContextRetriever:
         chunks.sort(key=lambda x: x['rerank_score'], reverse=True)
         return chunks
     
+    @staticmethod
+    def _build_source_info(metadata: Dict) -> str:
+        """Build the parenthesized source annotation for a chunk header"""
+        source_info = []
+
+        if metadata.get('page_number'):
+            source_info.append(f"Page {metadata['page_number']}")
+
+        if metadata.get('section_title'):
+            source_info.append(f"Section: {metadata['section_title']}")
+
+        return f" ({', '.join(source_info)})" if source_info else ""
+
     def _format_context(self, chunks: List[Dict]) -> str:
         """Format retrieved chunks into context string"""
         if not chunks:
             return ""
         
         context_parts = []
-        current_length = 0
-        
+        current_tokens = 0
+
+        # Batch-encode all chunk contents in one tokenizer call; the
+        # ordinary variant treats special-token literals like
+        # <|endoftext|> in uploaded documents as plain text instead of
+        # raising
+        chunk_tokens = self.encoding.encode_ordinary_batch(
+            [chunk['content'] for chunk in chunks]
+        )
+
         for i, chunk in enumerate(chunks):
             content = chunk['content']
-            
-            # Check if adding this chunk would exceed max context length
-            if current_length + len(content) > self.config.max_context_length:
-                # Try to fit a truncated version
-                remaining_space = self.config.max_context_length - current_length
-                if remaining_space > 100:  # Only if we have reasonable space left
-                    content = content[:remaining_space - 3] + "..."
+            tokens = chunk_tokens[i]
+
+            # Check if adding this chunk would exceed the token budget
+            if current_tokens + len(tokens) > self.config.max_context_tokens:
+                # Try to fit a truncated version, cut at a token boundary
+                remaining_tokens = self.config.max_context_tokens - current_tokens
+                if remaining_tokens > 25:  # Only if we have reasonable space left
+                    tokens = tokens[:remaining_tokens - 1]
+                    content = self.encoding.decode(tokens) + "…"
                 else:
                     break
-            
+
             # Format chunk with metadata if enabled
             if self.config.include_metadata:
-                metadata = chunk.get('full_metadata', {})
-                source_info = []
-                
-                if metadata.get('page_number'):
-                    source_info.append(f"Page {metadata['page_number']}")
-                
-                if metadata.get('section_title'):
-                    source_info.append(f"Section: {metadata['section_title']}")
-                
-                source_str = f" ({', '.join(source_info)})" if source_info else ""
-                
+                # Source info is precomputed at enrichment; only the source
+                # number depends on the final (post-rerank) ordering
+                source_str = chunk.get('_source_info')
+                if source_str is None:
+                    source_str = self._build_source_info(chunk.get('full_metadata', {}))
+
                 context_part = f"[Source {i+1}{source_str}]\n{content}\n"
             else:
                 context_part = f"{content}\n\n"
             
             context_parts.append(context_part)
-            current_length += len(context_part)
-        
+            current_tokens += len(tokens)
+
         return "\n".join(context_parts).strip()
     
+    # Frozen template for the empty response returned on every failure path
+    _EMPTY_METADATA: ClassVar[Dict] = MappingProxyType({
+        'query': "",
+        'total_chunks_found': 0,
+        'chunks_used': 0,
+        'context_length': 0,
+    })
+
     def _empty_context_response(self) -> Dict:
         """Return empty context response"""
         return {
             'context': "",
             'chunks': [],
             'metadata': {
-                'query': "",
-                'total_chunks_found': 0,
-                'chunks_used': 0,
-                'context_length': 0,
+                **self._EMPTY_METADATA,
                 'similarity_scores': [],
                 'document_sources': []
             }
@@ -16,7 +16,7 @@ import tiktoken
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class EmbeddingConfig:
     """Configuration for embedding generation"""
     model: str = "text-embedding-3-small"
@@ -24,6 +24,7 @@ class EmbeddingConfig:
     max_retries: int = 3
     retry_delay: float = 1.0
     rate_limit_delay: float = 0.1
+    max_concurrent_batches: int = 8
     dimensions: Optional[int] = None  # For newer OpenAI models
 
 class EmbeddingGenerator:
@@ -66,32 +67,37 @@ class EmbeddingGenerator:
                 logger.warning("No valid chunks to process")
                 return []
             
-            # Process chunks in batches
+            # Process batches concurrently with bounded parallelism -
+            # the API rate limit is RPM/TPM based, so overlapping requests
+            # is allowed and eliminates inter-batch idle time
+            batches = [
+                valid_chunks[i:i + self.config.batch_size]
+                for i in range(0, len(valid_chunks), self.config.batch_size)
+            ]
+            total_batches = len(batches)
+            semaphore = asyncio.Semaphore(self.config.max_concurrent_batches)
+
+            async def run_batch(batch_num: int, batch: List[Dict]) -> List[Dict]:
+                async with semaphore:
+                    logger.info(f"Processing embedding batch {batch_num}/{total_batches} ({len(batch)} chunks)")
+                    try:
+                        return await self._process_batch(batch)
+                    except Exception as e:
+                        logger.error(f"Error processing batch {batch_num}: {str(e)}")
+                        # Add chunks without embeddings to maintain order
+                        for chunk in batch:
+                            chunk['embedding'] = None
+                            chunk['embedding_error'] = str(e)
+                        return batch
+
+            batch_results = await asyncio.gather(
+                *[run_batch(i + 1, batch) for i, batch in enumerate(batches)]
+            )
+
             processed_chunks = []
-            total_batches = (len(valid_chunks) + self.config.batch_size - 1) // self.config.batch_size
-            
-            for i in range(0, len(valid_chunks), self.config.batch_size):
-                batch = valid_chunks[i:i + self.config.batch_size]
-                batch_num = i // self.config.batch_size + 1
-                
-                logger.info(f"Processing embedding batch {batch_num}/{total_batches} ({len(batch)} chunks)")
-                
-                try:
-                    batch_with_embeddings = await self._process_batch(batch)
-                    processed_chunks.extend(batch_with_embeddings)
-                    
-                    # Rate limiting between batches
-                    if i + self.config.batch_size < len(valid_chunks):
-                        await asyncio.sleep(self.config.rate_limit_delay)
-                        
-                except Exception as e:
-                    logger.error(f"Error processing batch {batch_num}: {str(e)}")
-                    # Add chunks without embeddings to maintain order
-                    for chunk in batch:
-                        chunk['embedding'] = None
-                        chunk['embedding_error'] = str(e)
-                    processed_chunks.extend(batch)
-            
+            for batch_result in batch_results:
+                processed_chunks.extend(batch_result)
+
             logger.info(f"Generated embeddings for {len([c for c in processed_chunks if c.get('embedding') is not None])}/{len(chunks)} chunks")
             return processed_chunks
             
@@ -3,15 +3,17 @@ Vector Store Module for RAG Pipeline
 Handles FAISS vector database operations for document embeddings
 """
 
+import asyncio
 import io
 import json
 import logging
 import pickle
-from typing import Dict, List, Optional, Tuple
-import tempfile
-import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import faiss
+import msgpack
 import numpy as np
 from firebase_admin import storage
 from google.cloud.exceptions import NotFound
@@ -20,16 +22,66 @@ logger = logging.getLogger(__name__)
 
 class FAISSVectorStore:
     """FAISS-based vector store for document embeddings"""
-    
+
+    # Chunks up to this size are stored verbatim in the index metadata so
+    # retrieval can skip the Firestore content fetch entirely
+    MAX_INLINE_CONTENT_CHARS = 8000
+
+    # Bounded LRU of initialized stores keyed by user_id, so warm requests
+    # skip the Cloud Storage load and index deserialization. Per-user locks
+    # keep concurrent loads for different users from serializing each other
+    _instance_cache: OrderedDict = OrderedDict()  # user_id -> (store, loaded_at)
+    _cache_lock = asyncio.Lock()
+    _user_locks: Dict[str, asyncio.Lock] = {}
+    _cache_size = 32
+    _cache_ttl = 300.0  # seconds
+
+    @classmethod
+    async def get_for_user(cls, user_id: str,
+                           embedding_dimension: int = 1536) -> Optional['FAISSVectorStore']:
+        """Get an initialized store for a user, reusing the cached instance"""
+        async with cls._cache_lock:
+            user_lock = cls._user_locks.setdefault(user_id, asyncio.Lock())
+
+        async with user_lock:
+            async with cls._cache_lock:
+                cached = cls._instance_cache.get(user_id)
+                if cached is not None:
+                    store, loaded_at = cached
+                    if time.monotonic() - loaded_at < cls._cache_ttl:
+                        cls._instance_cache.move_to_end(user_id)
+                        return store
+                    del cls._instance_cache[user_id]
+
+            store = cls(user_id, embedding_dimension)
+            if not await store.initialize_index():
+                return None
+
+            async with cls._cache_lock:
+                cls._instance_cache[user_id] = (store, time.monotonic())
+                while len(cls._instance_cache) > cls._cache_size:
+                    cls._instance_cache.popitem(last=False)
+            return store
+
+    @classmethod
+    def invalidate(cls, user_id: str):
+        """Drop a user's cached store (call after document updates)"""
+        cls._instance_cache.pop(user_id, None)
+
     def __init__(self, user_id: str, embedding_dimension: int = 1536):
         self.user_id = user_id
         self.embedding_dimension = embedding_dimension
         self.index_path = f"vector_indices/{user_id}/faiss_index"
-        self.metadata_path = f"vector_indices/{user_id}/metadata.json"
+        self.metadata_path = f"vector_indices/{user_id}/metadata.msgpack"
+        # Pre-msgpack indexes persisted metadata as JSON; kept for loading
+        self.legacy_metadata_path = f"vector_indices/{user_id}/metadata.json"
         
         # Initialize FAISS index
         self.index = None
+        self._on_gpu = False
         self.metadata = {}
+        # Direct vector_id -> chunk info map for O(1) search post-processing
+        self.vector_index: Dict[int, Dict] = {}
         self.bucket = storage.bucket()
         
     async def initialize_index(self) -> bool:
@@ -49,15 +101,66 @@ class FAISSVectorStore:
             logger.error(f"Error initializing FAISS index: {str(e)}")
             return False
     
+    # HNSW tuning: graph degree and construction/search beam widths.
+    # efSearch trades recall for query latency at search time.
+    HNSW_M = 32
+    HNSW_EF_CONSTRUCTION = 200
+    HNSW_EF_SEARCH = 64
+
+    # Only move an index to GPU past this size; below it, the transfer
+    # and kernel-launch overhead outweigh any search speedup
+    GPU_MIN_VECTORS = 50_000
+
+    _gpu_resources = None  # shared StandardGpuResources, created lazily
+
+    def _maybe_to_gpu(self, index):
+        """Best-effort GPU clone of a loaded CPU index
+
+        faiss-cpu builds have no GPU symbols at all, and not every index
+        type converts — in particular index_cpu_to_gpu has no GPU
+        implementation for the IndexHNSWSQ used here, so on current
+        builds this lands in the warning path and stays on CPU. The
+        guards keep it a safe no-op either way and pick the offload up
+        for free if the index type ever changes to a convertible one.
+        """
+        if not hasattr(faiss, 'StandardGpuResources') or faiss.get_num_gpus() == 0:
+            return index
+        if index.ntotal < self.GPU_MIN_VECTORS:
+            return index
+
+        try:
+            cls = type(self)
+            if cls._gpu_resources is None:
+                cls._gpu_resources = faiss.StandardGpuResources()
+            gpu_index = faiss.index_cpu_to_gpu(cls._gpu_resources, 0, index)
+            self._on_gpu = True
+            logger.info(f"Moved index with {index.ntotal} vectors to GPU")
+            return gpu_index
+        except Exception as e:
+            logger.warning(f"GPU offload unavailable, staying on CPU: {str(e)}")
+            return index
+
     def _create_new_index(self):
         """Create a new FAISS index"""
-        # Use IndexFlatIP for cosine similarity (after L2 normalization)
-        self.index = faiss.IndexFlatIP(self.embedding_dimension)
+        # HNSW graph index over inner product (cosine after L2 normalization);
+        # search is sub-linear in index size instead of an exhaustive scan.
+        # FP16 scalar-quantized storage halves memory and bandwidth with
+        # negligible recall loss for normalized embeddings.
+        self.index = faiss.IndexHNSWSQ(
+            self.embedding_dimension, faiss.ScalarQuantizer.QT_fp16,
+            self.HNSW_M, faiss.METRIC_INNER_PRODUCT
+        )
+        self.index.hnsw.efConstruction = self.HNSW_EF_CONSTRUCTION
+        self.index.hnsw.efSearch = self.HNSW_EF_SEARCH
+        # A rebuilt index always starts on CPU; clear any stale GPU flag
+        # so _save_index doesn't try to convert a CPU index back
+        self._on_gpu = False
         self.metadata = {
             'dimension': self.embedding_dimension,
             'total_vectors': 0,
             'document_chunks': {}
         }
+        self.vector_index = {}
     
     async def _load_index(self) -> bool:
         """Load existing FAISS index from Cloud Storage"""
@@ -67,20 +170,35 @@ class FAISSVectorStore:
             if not index_blob.exists():
                 return False
             
-            # Load metadata file
+            # Load metadata file, falling back to the legacy JSON blob for
+            # indexes saved before the msgpack switch
             metadata_blob = self.bucket.blob(self.metadata_path)
+            legacy_metadata = False
             if not metadata_blob.exists():
-                return False
-            
-            # Download and load index
-            with tempfile.NamedTemporaryFile() as temp_file:
-                index_blob.download_to_filename(temp_file.name)
-                self.index = faiss.read_index(temp_file.name)
-            
+                metadata_blob = self.bucket.blob(self.legacy_metadata_path)
+                legacy_metadata = True
+                if not metadata_blob.exists():
+                    return False
+
+            # Deserialize the index straight from memory; no tempfile or
+            # extra disk round trip. Downloads and deserialization block,
+            # so run them in worker threads to keep the event loop free
+            index_bytes = await asyncio.to_thread(index_blob.download_as_bytes)
+            self.index = await asyncio.to_thread(
+                faiss.deserialize_index, np.frombuffer(index_bytes, dtype=np.uint8)
+            )
+            self.index = self._maybe_to_gpu(self.index)
+
             # Download and load metadata
-            metadata_content = metadata_blob.download_as_text()
-            self.metadata = json.loads(metadata_content)
-            
+            if legacy_metadata:
+                metadata_text = await asyncio.to_thread(metadata_blob.download_as_text)
+                self.metadata = json.loads(metadata_text)
+            else:
+                metadata_bytes = await asyncio.to_thread(metadata_blob.download_as_bytes)
+                self.metadata = msgpack.unpackb(metadata_bytes, raw=False)
+            self._normalize_doc_records()
+            self._rebuild_vector_index()
+
             return True
             
         except Exception as e:
@@ -90,18 +208,31 @@ class FAISSVectorStore:
     async def _save_index(self):
         """Save FAISS index to Cloud Storage"""
         try:
-            # Save index file
-            with tempfile.NamedTemporaryFile() as temp_file:
-                faiss.write_index(self.index, temp_file.name)
-                
-                index_blob = self.bucket.blob(f"{self.index_path}.index")
-                index_blob.upload_from_filename(temp_file.name)
+            # Serialize the index in memory and upload directly, avoiding
+            # the write-to-disk/read-from-disk detour through a tempfile.
+            # Both steps block, so push them onto worker threads
+            # GPU indexes can't be serialized directly; clone back first
+            index_to_save = (
+                faiss.index_gpu_to_cpu(self.index) if self._on_gpu else self.index
+            )
+            index_bytes = await asyncio.to_thread(
+                lambda: faiss.serialize_index(index_to_save).tobytes()
+            )
+            index_blob = self.bucket.blob(f"{self.index_path}.index")
+            await asyncio.to_thread(
+                index_blob.upload_from_string,
+                index_bytes,
+                content_type='application/octet-stream'
+            )
             
-            # Save metadata file
+            # Save metadata file; msgpack serializes the chunk metadata an
+            # order of magnitude faster than pretty-printed JSON and the
+            # binary payload is substantially smaller on the wire
             metadata_blob = self.bucket.blob(self.metadata_path)
-            metadata_blob.upload_from_string(
-                json.dumps(self.metadata, indent=2),
-                content_type='application/json'
+            await asyncio.to_thread(
+                metadata_blob.upload_from_string,
+                msgpack.packb(self.metadata, use_bin_type=True),
+                content_type='application/msgpack'
             )
             
             logger.info(f"Saved FAISS index for user {self.user_id}")
@@ -116,56 +247,87 @@ class FAISSVectorStore:
             await self.initialize_index()
         
         try:
-            embeddings = []
-            chunk_metadata = []
-            
+            valid_chunks = []
             for chunk in chunks:
-                embedding = chunk.get('embedding')
-                if embedding is None:
+                if chunk.get('embedding') is None:
                     logger.warning(f"Skipping chunk {chunk.get('id')} - no embedding")
                     continue
-                
-                embeddings.append(embedding)
-                chunk_metadata.append({
+                valid_chunks.append(chunk)
+
+            if not valid_chunks:
+                logger.warning("No valid embeddings to add")
+                return False
+
+            chunk_metadata = [
+                {
                     'chunk_id': chunk['id'],
                     'document_id': chunk['document_id'],
                     'content': chunk['content'],
                     'metadata': chunk.get('metadata', {})
-                })
-            
-            if not embeddings:
-                logger.warning("No valid embeddings to add")
-                return False
-            
-            # Convert to numpy array and normalize for cosine similarity
-            embeddings_array = np.array(embeddings, dtype=np.float32)
-            faiss.normalize_L2(embeddings_array)
-            
-            # Add to index
+                }
+                for chunk in valid_chunks
+            ]
+
+            # Preallocate one contiguous float32 block and fill rows in
+            # place; avoids np.array's intermediate copies of a list of
+            # Python lists and hands FAISS exactly the layout it wants
+            embeddings_array = np.empty(
+                (len(valid_chunks), self.embedding_dimension), dtype=np.float32
+            )
+            for row, chunk in enumerate(valid_chunks):
+                embeddings_array[row] = chunk['embedding']
+
+            # Normalize in place for cosine similarity and add to the index
+            # in a worker thread; HNSW graph construction is CPU-heavy and
+            # would otherwise stall the event loop for large batches
             start_id = self.index.ntotal
-            self.index.add(embeddings_array)
+
+            def _normalize_and_add():
+                faiss.normalize_L2(embeddings_array)
+                self.index.add(embeddings_array)
+
+            await asyncio.to_thread(_normalize_and_add)
             
-            # Update metadata
+            # Update metadata. Chunks are stored as parallel arrays per
+            # document instead of a dict per chunk: at millions of chunks
+            # the per-dict overhead alone runs to hundreds of MB
             for i, chunk_meta in enumerate(chunk_metadata):
                 vector_id = start_id + i
                 document_id = chunk_meta['document_id']
-                
-                if document_id not in self.metadata['document_chunks']:
-                    self.metadata['document_chunks'][document_id] = []
-                
-                self.metadata['document_chunks'][document_id].append({
-                    'vector_id': vector_id,
+
+                record = self.metadata['document_chunks'].get(document_id)
+                if record is None:
+                    record = self.metadata['document_chunks'][document_id] = self._new_doc_record()
+
+                content = chunk_meta['content']
+                record['vector_ids'].append(vector_id)
+                record['chunk_ids'].append(chunk_meta['chunk_id'])
+                record['previews'].append(
+                    content[:200] + '...' if len(content) > 200 else content
+                )
+                record['metas'].append(chunk_meta['metadata'])
+                # Inline full content for reasonably-sized chunks; oversized
+                # ones fall back to the Firestore fetch at retrieval time
+                record['contents'].append(
+                    content if len(content) <= self.MAX_INLINE_CONTENT_CHARS else None
+                )
+
+                chunk_info = {
                     'chunk_id': chunk_meta['chunk_id'],
-                    'content_preview': chunk_meta['content'][:200] + '...' if len(chunk_meta['content']) > 200 else chunk_meta['content'],
+                    'document_id': document_id,
+                    'content_preview': record['previews'][-1],
                     'metadata': chunk_meta['metadata']
-                })
+                }
+                if record['contents'][-1] is not None:
+                    chunk_info['content'] = content
+                self.vector_index[vector_id] = chunk_info
             
             self.metadata['total_vectors'] = self.index.ntotal
             
             # Save updated index
             await self._save_index()
             
-            logger.info(f"Added {len(embeddings)} chunks to vector store")
+            logger.info(f"Added {len(valid_chunks)} chunks to vector store")
             return True
             
         except Exception as e:
@@ -178,69 +340,217 @@ class FAISSVectorStore:
             return []
         
         try:
-            # Normalize query embedding
-            query_array = np.array([query_embedding], dtype=np.float32)
-            faiss.normalize_L2(query_array)
-            
-            # Search
-            scores, indices = self.index.search(query_array, min(k, self.index.ntotal))
-            
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx == -1 or score < score_threshold:
-                    continue
-                
-                # Find chunk metadata
-                chunk_info = self._get_chunk_by_vector_id(int(idx))
-                if chunk_info:
-                    results.append({
-                        'chunk_id': chunk_info['chunk_id'],
-                        'document_id': chunk_info['document_id'],
-                        'content_preview': chunk_info['content_preview'],
-                        'metadata': chunk_info['metadata'],
-                        'similarity_score': float(score),
-                        'vector_id': int(idx)
-                    })
-            
-            return results
-            
+            # Normalize the single query with one BLAS dot plus a scale;
+            # cheaper per call than the faiss.normalize_L2 round trip and
+            # the epsilon guards against a zero vector
+            query_array = np.array(query_embedding, dtype=np.float32)
+            query_array /= np.sqrt(query_array @ query_array) + 1e-12
+            query_array = query_array[None, :]
+
+            # Search off the event loop; faiss releases the GIL internally
+            scores, indices = await asyncio.to_thread(
+                self.index.search, query_array, min(k, self.index.ntotal)
+            )
+
+            return self._collect_results(scores[0], indices[0], score_threshold)
+
         except Exception as e:
             logger.error(f"Error searching vector store: {str(e)}")
             return []
+
+    async def search_batch(self, query_embeddings: List[List[float]], k: int = 5,
+                           score_threshold: float = 0.0) -> List[List[Dict]]:
+        """Search for similar chunks for several queries in one FAISS call
+
+        FAISS parallelizes over the query dimension internally, so one
+        batched call is much cheaper than a search per query.
+        """
+        if not query_embeddings:
+            return []
+        if not self.index or self.index.ntotal == 0:
+            return [[] for _ in query_embeddings]
+
+        try:
+            query_array = np.array(query_embeddings, dtype=np.float32)
+            faiss.normalize_L2(query_array)
+
+            scores, indices = await asyncio.to_thread(
+                self.index.search, query_array, min(k, self.index.ntotal)
+            )
+
+            return [
+                self._collect_results(scores[row], indices[row], score_threshold)
+                for row in range(len(query_embeddings))
+            ]
+
+        except Exception as e:
+            logger.error(f"Error batch-searching vector store: {str(e)}")
+            return [[] for _ in query_embeddings]
+
+    def _collect_results(self, scores, indices, score_threshold: float) -> List[Dict]:
+        """Turn one query's raw FAISS hits into enriched result dicts"""
+        results = []
+        for score, idx in zip(scores, indices):
+            if idx == -1 or score < score_threshold:
+                continue
+
+            # Find chunk metadata
+            chunk_info = self._get_chunk_by_vector_id(int(idx))
+            if chunk_info:
+                result = {
+                    'chunk_id': chunk_info['chunk_id'],
+                    'document_id': chunk_info['document_id'],
+                    'content_preview': chunk_info['content_preview'],
+                    'metadata': chunk_info['metadata'],
+                    'similarity_score': float(score),
+                    'vector_id': int(idx)
+                }
+                if 'content' in chunk_info:
+                    result['content'] = chunk_info['content']
+                results.append(result)
+
+        return results
     
+    @staticmethod
+    def _new_doc_record() -> Dict:
+        """Empty parallel-array record for one document's chunks"""
+        return {
+            'vector_ids': [],
+            'chunk_ids': [],
+            'previews': [],
+            'metas': [],
+            'contents': []
+        }
+
+    @staticmethod
+    def _chunk_info_from_entry(document_id: str, entry: Dict) -> Dict:
+        """Build the lookup record for a legacy per-chunk dict entry"""
+        chunk_info = {
+            'chunk_id': entry['chunk_id'],
+            'document_id': document_id,
+            'content_preview': entry['content_preview'],
+            'metadata': entry['metadata']
+        }
+        if 'content' in entry:
+            chunk_info['content'] = entry['content']
+        return chunk_info
+
+    @classmethod
+    def _iter_doc_entries(cls, document_id: str, record) -> Iterator[Tuple[int, Dict]]:
+        """Yield (vector_id, chunk_info) pairs for one document's chunks
+
+        Understands both the compact parallel-array layout and the legacy
+        list-of-dicts layout still found in older persisted metadata.
+        """
+        if isinstance(record, dict):
+            for i, vector_id in enumerate(record['vector_ids']):
+                chunk_info = {
+                    'chunk_id': record['chunk_ids'][i],
+                    'document_id': document_id,
+                    'content_preview': record['previews'][i],
+                    'metadata': record['metas'][i]
+                }
+                if record['contents'][i] is not None:
+                    chunk_info['content'] = record['contents'][i]
+                yield vector_id, chunk_info
+        else:
+            for entry in record:
+                yield entry['vector_id'], cls._chunk_info_from_entry(document_id, entry)
+
+    def _normalize_doc_records(self):
+        """Convert legacy list-of-dicts records to the parallel-array layout
+
+        Read paths tolerate both layouts, but the append path in
+        add_chunks assumes parallel arrays; normalizing once at load time
+        keeps pre-migration documents writable, and the next save
+        re-persists them in the compact form.
+        """
+        document_chunks = self.metadata.get('document_chunks', {})
+        for document_id, record in document_chunks.items():
+            if isinstance(record, dict):
+                continue
+            new_record = self._new_doc_record()
+            for entry in record:
+                new_record['vector_ids'].append(entry['vector_id'])
+                new_record['chunk_ids'].append(entry['chunk_id'])
+                new_record['previews'].append(entry['content_preview'])
+                new_record['metas'].append(entry['metadata'])
+                new_record['contents'].append(entry.get('content'))
+            document_chunks[document_id] = new_record
+
+    def _rebuild_vector_index(self):
+        """Rebuild the vector_id lookup map from persisted metadata"""
+        self.vector_index = {
+            vector_id: chunk_info
+            for document_id, record in self.metadata.get('document_chunks', {}).items()
+            for vector_id, chunk_info in self._iter_doc_entries(document_id, record)
+        }
+
     def _get_chunk_by_vector_id(self, vector_id: int) -> Optional[Dict]:
         """Get chunk information by vector ID"""
-        for document_id, chunks in self.metadata['document_chunks'].items():
-            for chunk in chunks:
-                if chunk['vector_id'] == vector_id:
-                    return {
-                        'chunk_id': chunk['chunk_id'],
-                        'document_id': document_id,
-                        'content_preview': chunk['content_preview'],
-                        'metadata': chunk['metadata']
-                    }
-        return None
+        chunk_info = self.vector_index.get(vector_id)
+        if chunk_info is not None:
+            return chunk_info
+
+        # Metadata may have been replaced wholesale (e.g. in tests); rebuild
+        # the map once and retry before giving up
+        self._rebuild_vector_index()
+        return self.vector_index.get(vector_id)
     
     async def remove_document(self, document_id: str) -> bool:
         """Remove all chunks for a document from the vector store"""
         if not self.index or document_id not in self.metadata['document_chunks']:
             return True
-        
+
         try:
-            # Get vector IDs to remove
-            chunks_to_remove = self.metadata['document_chunks'][document_id]
-            vector_ids = [chunk['vector_id'] for chunk in chunks_to_remove]
-            
-            # FAISS doesn't support direct removal, so we need to rebuild the index
-            # This is a limitation we'll need to address in production
-            logger.warning(f"Document removal requires index rebuild - not implemented yet")
-            
-            # For now, just remove from metadata
             del self.metadata['document_chunks'][document_id]
+
+            # HNSW graphs don't support remove_ids, so rebuild the index
+            # from the surviving vectors. Their embeddings are reconstructed
+            # from the index's own storage, which avoids re-fetching and
+            # re-embedding anything
+            surviving = sorted(
+                (
+                    (vector_id, doc_id, chunk_info)
+                    for doc_id, record in self.metadata['document_chunks'].items()
+                    for vector_id, chunk_info in self._iter_doc_entries(doc_id, record)
+                ),
+                key=lambda item: item[0]
+            )
+
+            old_index = self.index
+            old_metadata = self.metadata
+            self._create_new_index()
+            self.metadata = old_metadata
+
+            rebuilt_chunks: Dict[str, Dict] = {}
+            if surviving:
+                vectors = np.empty(
+                    (len(surviving), self.embedding_dimension), dtype=np.float32
+                )
+                for row, (old_vector_id, doc_id, chunk_info) in enumerate(surviving):
+                    vectors[row] = old_index.reconstruct(old_vector_id)
+                    record = rebuilt_chunks.get(doc_id)
+                    if record is None:
+                        record = rebuilt_chunks[doc_id] = self._new_doc_record()
+                    record['vector_ids'].append(row)
+                    record['chunk_ids'].append(chunk_info['chunk_id'])
+                    record['previews'].append(chunk_info['content_preview'])
+                    record['metas'].append(chunk_info['metadata'])
+                    record['contents'].append(chunk_info.get('content'))
+                self.index.add(vectors)
+
+            self.metadata['document_chunks'] = rebuilt_chunks
+            self.metadata['total_vectors'] = self.index.ntotal
+            self._rebuild_vector_index()
             await self._save_index()
-            
+
+            logger.info(
+                f"Removed document {document_id}; index rebuilt with "
+                f"{self.index.ntotal} vectors"
+            )
             return True
-            
+
         except Exception as e:
             logger.error(f"Error removing document from vector store: {str(e)}")
             return False
@@ -259,7 +569,7 @@ class FAISSVectorStore:
             'total_vectors': self.index.ntotal,
             'total_documents': len(self.metadata['document_chunks']),
             'dimension': self.embedding_dimension,
-            'index_type': 'IndexFlatIP',
+            'index_type': type(self.index).__name__,
             'documents': list(self.metadata['document_chunks'].keys())
         }
     
@@ -0,0 +1,70 @@
+"""
+Shared test fixtures and fakes
+"""
+
+import json
+
+import pytest
+
+
+class FakeResponse:
+    """Minimal stand-in for an aiohttp response
+
+    Implements only the surface the OpenRouter client touches (status,
+    headers, read/json/text); avoids AsyncMock's attribute auto-creation
+    and call-recording overhead in hot integration tests.
+    """
+
+    def __init__(self, status, payload=None):
+        self.status = status
+        self.headers = {}
+        self._payload = payload
+
+    async def read(self):
+        return json.dumps(self._payload).encode()
+
+    async def json(self):
+        return self._payload
+
+    async def text(self):
+        return json.dumps(self._payload)
+
+
+class _FakeRequestContext:
+    """Async context manager returned by FakeSession.post"""
+
+    def __init__(self, response):
+        self._response = response
+
+    async def __aenter__(self):
+        return self._response
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class FakeSession:
+    """Minimal aiohttp.ClientSession stand-in with scripted responses"""
+
+    def __init__(self, responses):
+        self._responses = list(responses)
+        self.post_calls = 0
+        self.closed = False
+
+    def post(self, url, **kwargs):
+        self.post_calls += 1
+        return _FakeRequestContext(self._responses.pop(0))
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_llm_session():
+    """Factory building a FakeSession from (status, payload) pairs"""
+    def _make(*responses):
+        return FakeSession([
+            response if isinstance(response, FakeResponse) else FakeResponse(*response)
+            for response in responses
+        ])
+    return _make
@@ -5,6 +5,7 @@ Test suite for OpenRouter LLM integration
 import pytest
 import asyncio
 import json
+from types import MappingProxyType
 from unittest.mock import Mock, patch, AsyncMock
 import aiohttp
 
@@ -12,6 +13,26 @@ import aiohttp
 from src.llm.openrouter_client import OpenRouterClient, OpenRouterConfig, LLMResponse
 from src.llm.token_counter import TokenCounter
 
+# Frozen success-payload template for the integration tests; compose
+# per-test variants with _success_with instead of re-declaring the shape
+_BASE_SUCCESS = MappingProxyType({
+    "choices": [{"message": {"content": ""}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+})
+
+
+def _success_with(content: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> dict:
+    """Build a success response payload from the frozen template"""
+    return {
+        **_BASE_SUCCESS,
+        "choices": [{"message": {"content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
 class TestOpenRouterConfig:
     """Test OpenRouter configuration"""
     
@@ -44,11 +65,11 @@ class TestOpenRouterConfig:
 class TestOpenRouterClient:
     """Test OpenRouter client functionality"""
     
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def config(self):
         return OpenRouterConfig(api_key="test-key")
-    
-    @pytest.fixture
+
+    @pytest.fixture(scope="module")
     def client(self, config):
         return OpenRouterClient(config)
     
@@ -132,7 +153,7 @@ class TestOpenRouterClient:
 class TestTokenCounter:
     """Test token counting utilities"""
     
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def counter(self):
         return TokenCounter("meta-llama/llama-3.2-11b-vision-instruct:free")
     
@@ -238,70 +259,48 @@ class TestIntegration:
     """Integration tests for OpenRouter LLM functionality"""
     
     @pytest.mark.asyncio
-    async def test_mock_api_call(self):
+    async def test_mock_api_call(self, fake_llm_session):
         """Test mocked API call flow"""
         config = OpenRouterConfig(api_key="test-key")
         
         # Mock response data
-        mock_response_data = {
-            "choices": [{
-                "message": {"content": "Hello! How can I help you today?"},
-                "finish_reason": "stop"
-            }],
-            "usage": {
-                "prompt_tokens": 15,
-                "completion_tokens": 10,
-                "total_tokens": 25
-            }
-        }
+        mock_response_data = _success_with(
+            "Hello! How can I help you today?", prompt_tokens=15, completion_tokens=10
+        )
         
-        with patch('aiohttp.ClientSession.post') as mock_post:
-            # Mock the response
-            mock_response = AsyncMock()
-            mock_response.status = 200
-            mock_response.json = AsyncMock(return_value=mock_response_data)
-            mock_post.return_value.__aenter__.return_value = mock_response
-            
-            async with OpenRouterClient(config) as client:
-                response = await client.generate_response("Hello!")
-                
-                assert isinstance(response, LLMResponse)
-                assert response.content == "Hello! How can I help you today?"
-                assert response.usage["total_tokens"] == 25
-                assert response.cost_estimate == 0.0  # Free model
+        session = fake_llm_session((200, mock_response_data))
+
+        async with OpenRouterClient(config, session=session) as client:
+            response = await client.generate_response("Hello!")
+
+            assert isinstance(response, LLMResponse)
+            assert response.content == "Hello! How can I help you today?"
+            assert response.usage["total_tokens"] == 25
+            assert response.cost_estimate == 0.0  # Free model
+
+        assert session.post_calls == 1
     
     @pytest.mark.asyncio
-    async def test_context_enhanced_generation(self):
+    async def test_context_enhanced_generation(self, fake_llm_session):
         """Test context-enhanced generation"""
         config = OpenRouterConfig(api_key="test-key")
         
-        mock_response_data = {
-            "choices": [{
-                "message": {"content": "Based on the context, Paris is the capital of France."},
-                "finish_reason": "stop"
-            }],
-            "usage": {
-                "prompt_tokens": 50,
-                "completion_tokens": 15,
-                "total_tokens": 65
-            }
-        }
+        mock_response_data = _success_with(
+            "Based on the context, Paris is the capital of France.",
+            prompt_tokens=50, completion_tokens=15
+        )
         
-        with patch('aiohttp.ClientSession.post') as mock_post:
-            mock_response = AsyncMock()
-            mock_response.status = 200
-            mock_response.json = AsyncMock(return_value=mock_response_data)
-            mock_post.return_value.__aenter__.return_value = mock_response
-            
-            async with OpenRouterClient(config) as client:
-                response = await client.generate_with_context(
-                    prompt="What is the capital of France?",
-                    context="France is a country in Europe. Paris is its capital."
-                )
-                
-                assert isinstance(response, LLMResponse)
-                assert "Paris" in response.content
-                assert response.usage["total_tokens"] == 65
+        session = fake_llm_session((200, mock_response_data))
+
+        async with OpenRouterClient(config, session=session) as client:
+            response = await client.generate_with_context(
+                prompt="What is the capital of France?",
+                context="France is a country in Europe. Paris is its capital."
+            )
+
+            assert isinstance(response, LLMResponse)
+            assert "Paris" in response.content
+            assert response.usage["total_tokens"] == 65
     
     @pytest.mark.asyncio
     async def test_api_error_handling(self):
@@ -322,31 +321,22 @@ class TestIntegration:
                 assert "401" in str(exc_info.value)
     
     @pytest.mark.asyncio
-    async def test_rate_limit_retry(self):
+    async def test_rate_limit_retry(self, fake_llm_session):
         """Test rate limit retry logic"""
         config = OpenRouterConfig(api_key="test-key", max_retries=2, retry_delay=0.1)
         
-        success_response = {
-            "choices": [{
-                "message": {"content": "Success after retry"},
-                "finish_reason": "stop"
-            }],
-            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
-        }
+        success_response = _success_with(
+            "Success after retry", prompt_tokens=10, completion_tokens=5
+        )
         
-        with patch('aiohttp.ClientSession.post') as mock_post:
-            # First call returns 429, second succeeds
-            responses = [
-                AsyncMock(status=429),  # Rate limit
-                AsyncMock(status=200, json=AsyncMock(return_value=success_response))  # Success
-            ]
-            mock_post.return_value.__aenter__.side_effect = responses
-            
-            async with OpenRouterClient(config) as client:
-                response = await client.generate_response("Hello!")
-                
-                assert response.content == "Success after retry"
-                assert mock_post.call_count == 2  # Should have retried once
+        # First call returns 429, second succeeds
+        session = fake_llm_session((429, None), (200, success_response))
+
+        async with OpenRouterClient(config, session=session) as client:
+            response = await client.generate_response("Hello!")
+
+            assert response.content == "Success after retry"
+            assert session.post_calls == 2  # Should have retried once
 
 if __name__ == "__main__":
     pytest.main([__file__])
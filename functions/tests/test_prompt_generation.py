@@ -1,9 +1,42 @@
+import copy
 import pytest
 import json
 from unittest.mock import Mock, patch, AsyncMock
+
+try:
+    # Keep the test encoder on the same path production uses
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _dumps = json.dumps
 from firebase_functions import https_fn
 from main import generate_prompt, _generate_prompt_async, _build_generation_prompt, _calculate_quality_score
 
+# Shared request payload template; fixtures deep-copy it so tests that
+# mutate their request can't leak changes into each other
+_BASE_REQUEST_DATA = {
+    'purpose': 'Generate customer support responses',
+    'industry': 'Technology',
+    'useCase': 'Customer Support',
+    'targetAudience': 'Technical users',
+    'inputVariables': [
+        {
+            'name': 'customer_name',
+            'description': 'Name of the customer',
+            'type': 'string',
+            'required': True,
+            'example': 'John Smith'
+        }
+    ],
+    'outputFormat': 'paragraph',
+    'tone': 'professional',
+    'length': 'medium',
+    'includeRAG': False,
+    'additionalRequirements': 'Include empathy and solution focus'
+}
+
 
 class TestPromptGeneration:
     """Test cases for AI prompt generation functionality"""
@@ -14,33 +47,14 @@ class TestPromptGeneration:
         request = Mock()
         request.auth = Mock()
         request.auth.uid = 'test-user-123'
-        request.data = {
-            'purpose': 'Generate customer support responses',
-            'industry': 'Technology',
-            'useCase': 'Customer Support',
-            'targetAudience': 'Technical users',
-            'inputVariables': [
-                {
-                    'name': 'customer_name',
-                    'description': 'Name of the customer',
-                    'type': 'string',
-                    'required': True,
-                    'example': 'John Smith'
-                }
-            ],
-            'outputFormat': 'paragraph',
-            'tone': 'professional',
-            'length': 'medium',
-            'includeRAG': False,
-            'additionalRequirements': 'Include empathy and solution focus'
-        }
+        request.data = copy.deepcopy(_BASE_REQUEST_DATA)
         return request
 
     @pytest.fixture
     def mock_openrouter_response(self):
         """Create a mock OpenRouter response"""
         response = Mock()
-        response.content = json.dumps({
+        response.content = _dumps({
             'generatedPrompt': 'You are a helpful customer support agent. When responding to {{customer_name}}, always be empathetic and solution-focused.',
             'title': 'Customer Support Response Generator',
             'description': 'Generates empathetic customer support responses',
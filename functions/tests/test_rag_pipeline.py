@@ -4,48 +4,52 @@ Test suite for RAG processing pipeline components
 
 import pytest
 import asyncio
-import tempfile
-import os
 from unittest.mock import Mock, patch, AsyncMock
 
-# Import components to test
-from src.rag.document_processor import DocumentProcessor
-from src.rag.text_chunker import TextChunker, ChunkingConfig
-from src.rag.embedding_generator import EmbeddingGenerator, EmbeddingConfig
-from src.rag.vector_store import FAISSVectorStore
-from src.rag.context_retriever import ContextRetriever, RetrievalConfig
+import numpy as np
+
+# The src.rag modules are imported lazily inside the fixtures that need
+# them: vector_store pulls in the FAISS native library and
+# embedding_generator the OpenAI SDK, so targeted runs (e.g.
+# `pytest -k TestTextChunker`) skip those load costs entirely.
+# sys.modules caches each module after its first fixture use.
+
+# Shared sample texts, built once per session (underscore-prefixed so
+# pytest doesn't try to collect them)
+_SAMPLE_CHUNK_TEXT = "This is a test document. " * 20
+_SAMPLE_INTEGRATION_TEXT = "This is a sample document. " * 50
+
+# Pre-built float32 embeddings: skips the per-call list-to-ndarray
+# conversion and pins the dtype the similarity kernel expects
+_E1 = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+_E3 = np.array([0.0, 1.0, 0.0], dtype=np.float32)
 
 class TestDocumentProcessor:
     """Test document processing functionality"""
     
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def processor(self):
+        from src.rag.document_processor import DocumentProcessor
         return DocumentProcessor()
     
-    def test_content_type_detection(self, processor):
+    @pytest.mark.parametrize("content,name,expected", [
+        (b'%PDF-1.4', 'test.pdf', 'application/pdf'),
+        (b'Hello world', 'test.txt', 'text/plain'),
+        (b'PK\x03\x04', 'test.docx',
+         'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    ], ids=['pdf', 'text', 'docx'])
+    def test_content_type_detection(self, processor, content, name, expected):
         """Test content type detection from file content"""
-        # PDF content
-        pdf_content = b'%PDF-1.4'
-        assert processor._detect_content_type(pdf_content, 'test.pdf') == 'application/pdf'
-        
-        # Text content
-        text_content = b'Hello world'
-        assert processor._detect_content_type(text_content, 'test.txt') == 'text/plain'
-        
-        # DOCX content (ZIP-based)
-        docx_content = b'PK\x03\x04'
-        assert processor._detect_content_type(docx_content, 'test.docx') == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-    
-    def test_document_validation(self, processor):
+        assert processor._detect_content_type(content, name) == expected
+
+    @pytest.mark.parametrize("mime,size,expected", [
+        ('text/plain', 1000, True),
+        ('image/jpeg', 1000, False),          # Unsupported type
+        ('text/plain', 20 * 1024 * 1024, False),  # Too large
+    ], ids=['valid', 'unsupported-type', 'too-large'])
+    def test_document_validation(self, processor, mime, size, expected):
         """Test document validation"""
-        # Valid document
-        assert processor.validate_document('text/plain', 1000) == True
-        
-        # Unsupported type
-        assert processor.validate_document('image/jpeg', 1000) == False
-        
-        # Too large
-        assert processor.validate_document('text/plain', 20 * 1024 * 1024) == False
+        assert processor.validate_document(mime, size) == expected
     
     def test_text_extraction_from_text(self, processor):
         """Test text extraction from plain text"""
@@ -59,10 +63,15 @@ class TestDocumentProcessor:
 class TestTextChunker:
     """Test text chunking functionality"""
     
-    @pytest.fixture
-    def chunker(self):
-        config = ChunkingConfig(chunk_size=100, chunk_overlap=20)
-        return TextChunker(config)
+    @pytest.fixture(scope="module")
+    def _chunk_cfg(self):
+        from src.rag.text_chunker import ChunkingConfig
+        return ChunkingConfig(chunk_size=100, chunk_overlap=20)
+
+    @pytest.fixture(scope="module")
+    def chunker(self, _chunk_cfg):
+        from src.rag.text_chunker import TextChunker
+        return TextChunker(_chunk_cfg)
     
     def test_text_preprocessing(self, chunker):
         """Test text preprocessing"""
@@ -72,8 +81,7 @@ class TestTextChunker:
     
     def test_chunk_creation(self, chunker):
         """Test basic chunk creation"""
-        text = "This is a test document. " * 20  # Create longer text
-        chunks = chunker.chunk_text(text, "test_doc", {})
+        chunks = chunker.chunk_text(_SAMPLE_CHUNK_TEXT, "test_doc", {})
         
         assert len(chunks) > 0
         assert all('id' in chunk for chunk in chunks)
@@ -93,10 +101,15 @@ class TestTextChunker:
 class TestEmbeddingGenerator:
     """Test embedding generation functionality"""
     
-    @pytest.fixture
-    def generator(self):
-        config = EmbeddingConfig(model="text-embedding-3-small", batch_size=2)
-        return EmbeddingGenerator(config, api_key="test-key")
+    @pytest.fixture(scope="module")
+    def _emb_cfg(self):
+        from src.rag.embedding_generator import EmbeddingConfig
+        return EmbeddingConfig(model="text-embedding-3-small", batch_size=2)
+
+    @pytest.fixture(scope="module")
+    def generator(self, _emb_cfg):
+        from src.rag.embedding_generator import EmbeddingGenerator
+        return EmbeddingGenerator(_emb_cfg, api_key="test-key")
     
     def test_chunk_validation(self, generator):
         """Test chunk validation"""
@@ -111,19 +124,15 @@ class TestEmbeddingGenerator:
         assert len(valid_chunks) == 2
         assert all(chunk['content'] for chunk in valid_chunks)
     
-    @pytest.mark.asyncio
+    @pytest.mark.asyncio(loop_scope="session")
     async def test_similarity_calculation(self, generator):
         """Test similarity calculation"""
-        embedding1 = [1.0, 0.0, 0.0]
-        embedding2 = [1.0, 0.0, 0.0]
-        embedding3 = [0.0, 1.0, 0.0]
-        
         # Identical embeddings
-        similarity = generator.calculate_similarity(embedding1, embedding2)
+        similarity = generator.calculate_similarity(_E1, _E1)
         assert similarity == pytest.approx(1.0, rel=1e-5)
-        
+
         # Orthogonal embeddings
-        similarity = generator.calculate_similarity(embedding1, embedding3)
+        similarity = generator.calculate_similarity(_E1, _E3)
         assert similarity == pytest.approx(0.0, rel=1e-5)
     
     def test_embedding_stats(self, generator):
@@ -143,13 +152,25 @@ class TestEmbeddingGenerator:
 class TestVectorStore:
     """Test FAISS vector store functionality"""
     
+    @pytest.fixture(scope="module")
+    def _vs_template(self):
+        # Index construction allocates native FAISS state; build it once
+        # per module and let the function-scoped wrapper reset test state
+        from src.rag.vector_store import FAISSVectorStore
+        store = FAISSVectorStore("test_user", embedding_dimension=3)
+        store._create_new_index()
+        return store
+
     @pytest.fixture
-    def vector_store(self):
-        return FAISSVectorStore("test_user", embedding_dimension=3)
+    def vector_store(self, _vs_template):
+        # The store itself is shared across the module; reset the mutable
+        # chunk bookkeeping so tests can't leak state into each other
+        _vs_template.metadata['document_chunks'] = {}
+        _vs_template._rebuild_vector_index()
+        return _vs_template
     
     def test_initialization(self, vector_store):
         """Test vector store initialization"""
-        vector_store._create_new_index()
         assert vector_store.index is not None
         assert vector_store.metadata['dimension'] == 3
         assert vector_store.metadata['total_vectors'] == 0
@@ -162,10 +183,9 @@ class TestVectorStore:
         assert 'dimension' in stats
         assert stats['dimension'] == 3
     
-    @pytest.mark.asyncio
+    @pytest.mark.asyncio(loop_scope="session")
     async def test_chunk_metadata_lookup(self, vector_store):
         """Test chunk metadata lookup by vector ID"""
-        vector_store._create_new_index()
         vector_store.metadata['document_chunks'] = {
             'doc1': [
                 {'vector_id': 0, 'chunk_id': 'chunk1', 'content_preview': 'test content', 'metadata': {}}
@@ -177,14 +197,28 @@ class TestVectorStore:
         assert chunk_info['chunk_id'] == 'chunk1'
         assert chunk_info['document_id'] == 'doc1'
 
+class _StubEmbGen:
+    """Embedding generator stand-in covering the surface ContextRetriever
+    touches; cheaper per call than Mock's auto-created attributes"""
+
+    async def generate_query_embedding(self, query):
+        return [0.0, 0.0, 0.0]
+
+    def calculate_similarity(self, embedding1, embedding2):
+        return 0.0
+
 class TestContextRetriever:
     """Test context retrieval functionality"""
-    
-    @pytest.fixture
-    def retriever(self):
-        mock_embedding_generator = Mock()
-        config = RetrievalConfig(top_k=3, similarity_threshold=0.5)
-        return ContextRetriever(mock_embedding_generator, config)
+
+    @pytest.fixture(scope="module")
+    def _ret_cfg(self):
+        from src.rag.context_retriever import RetrievalConfig
+        return RetrievalConfig(top_k=3, similarity_threshold=0.5)
+
+    @pytest.fixture(scope="module")
+    def retriever(self, _ret_cfg):
+        from src.rag.context_retriever import ContextRetriever
+        return ContextRetriever(_StubEmbGen(), _ret_cfg)
     
     def test_empty_context_response(self, retriever):
         """Test empty context response structure"""
@@ -214,7 +248,7 @@ class TestContextRetriever:
         assert 'Page 1' in context
         assert 'Introduction' in context
     
-    @pytest.mark.asyncio
+    @pytest.mark.asyncio(loop_scope="session")
     async def test_chunk_reranking(self, retriever):
         """Test chunk reranking functionality"""
         query = "test query"
@@ -233,24 +267,25 @@ class TestContextRetriever:
         scores = [chunk['rerank_score'] for chunk in reranked]
         assert scores == sorted(scores, reverse=True)
 
+@pytest.mark.slow
 class TestIntegration:
     """Integration tests for the complete RAG pipeline"""
     
-    @pytest.mark.asyncio
+    @pytest.mark.asyncio(loop_scope="session")
     async def test_document_processing_pipeline(self):
         """Test the complete document processing pipeline"""
         # This would be a more complex integration test
         # that tests the entire flow from document upload to vector storage
         
         # Mock components for integration test
+        from src.rag.document_processor import DocumentProcessor
+        from src.rag.text_chunker import TextChunker
+
         processor = DocumentProcessor()
         chunker = TextChunker()
         
-        # Test with sample text document
-        sample_text = "This is a sample document. " * 50  # Create substantial content
-        
-        # Test chunking
-        chunks = chunker.chunk_text(sample_text, "test_doc", {})
+        # Test chunking with substantial sample content
+        chunks = chunker.chunk_text(_SAMPLE_INTEGRATION_TEXT, "test_doc", {})
         assert len(chunks) > 0
         
         # Verify chunk structure